@@ -1,7 +1,14 @@
 import os
+from collections import OrderedDict
+import pandas as pd
+from dataclasses import asdict
 import streamlit as st
-from typing import List, Dict, Any
-from recommender import CocktailRecommender
+import torch
+from functools import lru_cache
+from html import escape
+from itertools import islice
+from typing import List, Dict, Any, Optional, Tuple
+from recommender import get_recommender as shared_recommender
 
 # -------------------- Page config -------------------- #
 st.set_page_config(
@@ -12,8 +19,11 @@ st.set_page_config(
 )
 
 # -------------------- Styles -------------------- #
-st.markdown(
-    """
+CSS_VERSION = "2"
+
+@st.cache_data
+def _css(version: str) -> str:
+    return """
 <style>
   :root{
     --bg: #0b0c10;
@@ -41,10 +51,6 @@ st.markdown(
     -webkit-background-clip: text;
     -webkit-text-fill-color: transparent;
   }
-  .subtitle{
-    margin-top: .1rem;
-    color: var(--muted);
-  }
 
   /* Utility bar */
   .bar{
@@ -66,6 +72,7 @@ st.markdown(
     transition: transform .18s ease, box-shadow .18s ease, border-color .18s ease;
     min-height: 45px;
   }
+  .card-grid{ display:grid; gap:1rem; margin-bottom:1rem; }
   .card:hover{
     transform: translateY(-2px);
     border-color: rgba(255,255,255,.12);
@@ -116,23 +123,121 @@ st.markdown(
     margin-bottom: .6rem !important;
   }
 </style>
-""",
-    unsafe_allow_html=True,
-)
-
+"""
 
 @st.cache_resource
 def get_recommender():
-    return CocktailRecommender()
+    # Torch threading and eval mode are set up by the recommender module
+    rec = shared_recommender()
+    # Every pickable term of the vector modes, embedded up front in one batch;
+    # any combination of them is then served from these embeddings
+    rec.warm_vocabulary(
+        ingredients=COMMON_INGREDIENTS,
+        style=STYLE_OPTIONS + MIX_STYLE_OPTIONS,
+        occasion=OCCASION_OPTIONS + MIX_OCCASION_OPTIONS,
+        alcoholic=ALCOHOL_OPTIONS,
+    )
+    if os.getenv("TORCH_COMPILE", "0") == "1":
+        # Opt-in: compilation needs a C++ toolchain and stalls the first query.
+        # Compile the inner transformer so SentenceTransformer.encode still works.
+        try:
+            backbone = rec.model[0]
+            backbone.auto_model = torch.compile(backbone.auto_model, dynamic=True)
+        except Exception as e:
+            print(f"torch.compile unavailable, using eager mode: {e}")
+    return rec
+
+def _canonical(items: List[str]) -> List[str]:
+    # Same selection in any order/case -> same cache entry
+    return sorted({x.strip().lower() for x in items if x.strip()})
+
+def _format_row(row: Any) -> Dict[str, Any]:
+    # Cocktail -> card dict, similarity as a percentage
+    cocktail = asdict(row)
+    if cocktail["similarity"] is None:
+        del cocktail["similarity"]
+    else:
+        cocktail["similarity"] = round(cocktail["similarity"] * 100, 1)
+    return cocktail
+
+def _prefs(ingredients: List[str] = (), style: List[str] = (), occasion: str = "", alcoholic: str = "") -> Tuple:
+    # Hashable cache key for the preference searches
+    return (tuple(_canonical(ingredients)), tuple(_canonical(style)), occasion, alcoholic)
+
+@st.cache_data(ttl=3600, max_entries=1024)
+def _embed(prefs: Tuple):
+    """Query embedding, cached separately so Top-K/threshold changes reuse it."""
+    ingredients, style, occasion, alcoholic = prefs
+    return get_recommender().embed_preferences(ingredients, style, occasion or None, alcoholic or None)
+
+# The cached lookups below let database errors propagate: st.cache_data doesn't
+# store a raised exception, so an outage isn't cached as "no results"
+@st.cache_data(ttl=600, max_entries=256)
+def _vector_search(prefs: Tuple, top_k: int, threshold: float):
+    """Embed the preferences and return the nearest matches."""
+    emb = _embed(prefs)
+    return get_recommender().search_similar_cocktails(emb, limit=top_k, threshold=threshold, raise_errors=True)
+
+# Name/category lookups are deterministic
+@st.cache_data(ttl=600, max_entries=256)
+def _by_name(name: str):
+    return get_recommender().get_cocktail_by_name(name, raise_errors=True)
+
+@st.cache_data(ttl=600, max_entries=64)
+def _by_cat(category: str, limit: int):
+    return get_recommender().get_cocktail_by_category(category, limit=limit, raise_errors=True)
+
+# Random draws are keyed on a per-click nonce: each Roll is a fresh draw,
+# reruns within the same roll are served from cache
+@st.cache_data(ttl=600, max_entries=16)
+def _random(limit: int, nonce: int):
+    return get_recommender().get_random_cocktails(limit=limit, raise_errors=True)
+
+def _show_results(lookup, *args) -> bool:
+    """Run a cached lookup into the results; on failure report it and keep the current results."""
+    try:
+        rows = lookup(*args)
+    except Exception as e:
+        st.error(f"Search failed, please try again.\n\n{e}")
+        return False
+    st.session_state["results"] = [_format_row(r) for r in rows]
+    return True
+
+COMMON_INGREDIENTS: Tuple[str, ...] = (
+    "vodka","gin","rum","whiskey","tequila","bourbon",
+    "lime","lemon","orange","cranberry","pineapple",
+    "mint","basil","simple syrup","triple sec","vermouth",
+)
 
-@st.cache_data
-def common_ingredients() -> List[str]:
-    return [
-        "vodka","gin","rum","whiskey","tequila","bourbon",
-        "lime","lemon","orange","cranberry","pineapple",
-        "mint","basil","simple syrup","triple sec","vermouth",
-    ]
+# Option lists are allocated once at import, not on every rerun
+MODES: Tuple[str, ...] = (
+    "🔍 Search by Name",
+    "🥃 By Ingredients",
+    "🎭 By Style/Mood",
+    "🎉 By Occasion",
+    "🎲 Mixed Preferences",
+    "📂 By Category",
+    "🎰 Random Discovery",
+)
+STYLE_OPTIONS: Tuple[str, ...] = (
+    "sweet","sour","bitter","strong","light","fruity","creamy","refreshing","exotic","classic","tropical",
+)
+OCCASION_OPTIONS: Tuple[str, ...] = (
+    "", "party", "date night", "summer evening", "winter warmer", "brunch", "after dinner", "celebration", "relaxing at home",
+)
+MIX_STYLE_OPTIONS: Tuple[str, ...] = ("sweet","sour","strong","light","fruity","refreshing")
+MIX_OCCASION_OPTIONS: Tuple[str, ...] = ("", "party","date night","summer","winter","brunch")
+ALCOHOL_OPTIONS: Tuple[str, ...] = ("", "Alcoholic","Non alcoholic","Optional alcohol")
+CATEGORY_OPTIONS: Tuple[str, ...] = (
+    "", "Ordinary Drink", "Cocktail", "Shot", "Coffee / Tea", "Homemade Liqueur", "Punch / Party Drink", "Beer", "Soft Drink",
+)
 
+@st.cache_data(max_entries=64)
+def _results_csv(rows_key: tuple) -> bytes:
+    df = pd.DataFrame(list(rows_key), columns=["name", "similarity", "category", "alcoholic"])
+    return df.to_csv(index=False).encode()
+
+@lru_cache(maxsize=4096)
 def _format_similarity(sim: Any) -> str:
     if sim is None: return "—"
     try:
@@ -144,60 +249,81 @@ def _format_similarity(sim: Any) -> str:
     except Exception:
         return str(sim)
 
-def _listize_ingredients(raw: Any, limit:int=14) -> List[str]:
+@lru_cache(maxsize=4096)
+def _listize_ingredients(raw: Any, limit: Optional[int] = 14) -> Tuple[str, ...]:
     if not raw: 
-        return []
-    ings = [i.strip() for i in str(raw).split(",") if i.strip()]
+        return ()
+    ings = tuple(i.strip() for i in str(raw).split(",") if i.strip())
     return ings[:limit]
 
+@lru_cache(maxsize=4096)
+def _esc(value: Any) -> str:
+    # DB fields are interpolated into raw HTML
+    return escape(str(value))
+
 def _ensure_state():
-    st.session_state.setdefault("results", [])
-    st.session_state.setdefault("last_mode", "")
-    st.session_state.setdefault("favorites", set())
-    st.session_state.setdefault("history", [])
+    # Build defaults only when missing; setdefault would allocate them every rerun
+    state = st.session_state
+    if "results" not in state:
+        state["results"] = []
+    if "last_mode" not in state:
+        state["last_mode"] = ""
+    if "favorites" not in state:
+        state["favorites"] = set()
+    if "history" not in state:
+        state["history"] = OrderedDict()
 
 def _push_history(label: str):
     if not label: 
         return
-    if label not in st.session_state["history"]:
-        st.session_state["history"] = ([label] + st.session_state["history"])[:8]
+    # Insertion-ordered LRU: newest label last, oldest evicted first
+    h = st.session_state["history"]
+    h.pop(label, None)
+    h[label] = None
+    while len(h) > 8:
+        h.popitem(last=False)
 
 # -------------------- Card component -------------------- #
-def display_cocktail(cocktail: Dict[str, Any]) -> None:
-    name = cocktail.get("name","(unknown)")
-    category = cocktail.get("category","—")
-    alcoholic = cocktail.get("alcoholic","—")
-    glass = cocktail.get("glass","—")
+def card_html(cocktail: Dict[str, Any]) -> str:
+    name = _esc(cocktail.get("name","(unknown)"))
+    category = _esc(cocktail.get("category","—"))
+    alcoholic = _esc(cocktail.get("alcoholic","—"))
+    glass = _esc(cocktail.get("glass","—"))
     sim_txt = _format_similarity(cocktail.get("similarity"))
-    ings = _listize_ingredients(cocktail.get("ingredients"))
-    recipe = cocktail.get("recipe","")
+    all_ings = _listize_ingredients(cocktail.get("ingredients"), limit=None)
+    ings = [_esc(i) for i in all_ings[:12]]
 
-    st.markdown('<div class="card">', unsafe_allow_html=True)
-    st.markdown(f"<h3>🍸 {name}</h3>", unsafe_allow_html=True)
+    parts: List[str] = []
+    parts.append(f"<div class='card'><h3>🍸 {name}</h3>")
 
     # Row: meta + similarity
-    st.markdown(
-        f"""
-        <div class='row-meta'>
+    parts.append(
+        f"""<div class='row-meta'>
           <span class='pill'>Category: {category}</span>
           <span class='pill'>Type: {alcoholic}</span>
           <span class='pill'>Glass: {glass}</span>
           <span class='pill pill-sim'>Match {sim_txt}</span>
-        </div>
-        """,
-        unsafe_allow_html=True,
+        </div>"""
     )
 
     # Ingredients as chips (grid)
     if ings:
-        st.markdown("<div class='muted' style='margin:.1rem 0 .2rem 0;'><b>Ingredients</b></div>", unsafe_allow_html=True)
-        st.markdown("<div class='tags'>", unsafe_allow_html=True)
-        for ing in ings:
-            st.markdown(f"<span class='pill pill-tag'>{ing}</span>", unsafe_allow_html=True)
-        st.markdown("</div>", unsafe_allow_html=True)
-
-    # Recipe expander + sticky footer actions
-    with st.expander("📖 Recipe"):
+        parts.append("<div class='muted' style='margin:.1rem 0 .2rem 0;'><b>Ingredients</b></div>")
+        parts.append("<div class='tags'>")
+        parts.append("".join(f"<span class='pill pill-tag'>{ing}</span>" for ing in ings))
+        if len(all_ings) > 12:
+            # The full list is in the recipe expander
+            parts.append(f"<span class='pill'>+{len(all_ings) - 12} more</span>")
+        parts.append("</div>")
+    parts.append("</div>")
+    return "".join(parts)
+
+def display_card_actions(cocktail: Dict[str, Any], key_prefix: str = "") -> None:
+    name = cocktail.get("name","(unknown)")
+    recipe = cocktail.get("recipe","")
+
+    # Recipe expander + download
+    with st.expander(f"📖 {name}"):
         if recipe:
             st.write(recipe)
         else:
@@ -207,28 +333,31 @@ def display_cocktail(cocktail: Dict[str, Any]) -> None:
             (recipe or f"{name}\n(No instructions available)"),
             file_name=f"{name.replace(' ', '_')}_recipe.txt",
             mime="text/plain",
+            key=f"{key_prefix}dl-{name}",
             use_container_width=True,
         )
 
-    # Footer actions (favorite toggle)
-    is_fav = name in st.session_state["favorites"]
-    col1, col2 = st.columns([1,1])
-    with col1:
-        if st.button(("💖 Remove Favorite" if is_fav else "🤍 Add Favorite"),
-                     key=f"fav-{name}", use_container_width=True):
-            if is_fav:
-                st.session_state["favorites"].discard(name)
-                st.toast(f"Removed **{name}** from favorites", icon="🗑️")
-            else:
-                st.session_state["favorites"].add(name)
-                st.toast(f"Saved **{name}** to favorites", icon="💖")
-    with col2:
-        st.caption(f"Similarity: {sim_txt}")
-
-    st.markdown("</div>", unsafe_allow_html=True)
+    # Favorite toggle (the set is mutated in place, so a local binding persists)
+    favs = st.session_state["favorites"]
+    is_fav = name in favs
+    if st.button(("💖 Remove Favorite" if is_fav else "🤍 Add Favorite"),
+                 key=f"{key_prefix}fav-{name}", use_container_width=True):
+        if is_fav:
+            favs.discard(name)
+            st.toast(f"Removed **{name}** from favorites", icon="🗑️")
+        else:
+            favs.add(name)
+            st.toast(f"Saved **{name}** to favorites", icon="💖")
+        # Favorites are listed outside the results fragment
+        st.rerun()
 
 # -------------------- Results grid -------------------- #
-def render_cards(results: List[Dict[str, Any]], per_row: int = 3, compact: bool = False) -> None:
+def render_cards(
+    results: List[Dict[str, Any]],
+    per_row: int = 3,
+    compact: bool = False,
+    key_prefix: str = "",
+) -> None:
     if not results:
         st.markdown(
             "<div class='empty'>No cocktails found. Try different ingredients, lower the threshold, or switch modes.</div>",
@@ -237,22 +366,149 @@ def render_cards(results: List[Dict[str, Any]], per_row: int = 3, compact: bool
         return
     if compact:
         per_row = max(2, per_row + 1)  # slightly denser
-    rows = [results[i:i+per_row] for i in range(0, len(results), per_row)]
-    for row in rows:
+
+    # All card visuals go out as one element, laid out by CSS grid. The HTML is
+    # rebuilt only when the result set or layout changes between reruns.
+    grid_hash = hash((tuple((r.get("name"), r.get("similarity")) for r in results), per_row))
+    memo_key = f"_{key_prefix}grid_html"
+    memo = st.session_state.get(memo_key)
+    if memo is None or memo[0] != grid_hash:
+        cards = "".join(card_html(item) for item in results)
+        grid = f"<div class='card-grid' style='grid-template-columns:repeat({per_row},minmax(0,1fr));'>{cards}</div>"
+        memo = (grid_hash, grid)
+        st.session_state[memo_key] = memo
+    st.markdown(memo[1], unsafe_allow_html=True)
+
+    # Widgets can't live inside HTML, so the actions follow in a matching grid
+    it = iter(results)
+    while row := list(islice(it, per_row)):
         cols = st.columns(per_row)
         for c, item in zip(cols, row):
             with c:
-                display_cocktail(item)
+                display_card_actions(item, key_prefix=key_prefix)
+
+# -------------------- Search + results panel -------------------- #
+@st.fragment
+def results_panel(
+    mode: str,
+    top_k: int,
+    sim_thresh: float,
+    per_row: int,
+    compact: bool,
+    quick: List[str],
+) -> None:
+    # Runs as a fragment: typing, picking options and card actions rerun only
+    # this panel. A new result set triggers a full rerun.
+    before = st.session_state["results"]
+
+    # ----------------- MODE: Search by Name -----------------
+    if mode == "🔍 Search by Name":
+        st.subheader("Search by Name")
+        name = st.text_input("Type a cocktail name", placeholder="e.g., Margarita, Mojito, Negroni")
+        if name:
+            with st.spinner("Searching…"):
+                _push_history(name.strip())
+                _show_results(_by_name, name)
+
+    # ----------------- MODE: Ingredients (vector) -----------
+    elif mode == "🥃 By Ingredients":
+        st.subheader("Find by Ingredients")
+        col_a, col_b = st.columns([2,3])
+        with col_a:
+            custom = st.text_input("Add custom ingredients", placeholder="comma-separated, e.g., gin, lemon")
+        ingredients = quick.copy()
+        if custom:
+            ingredients += [x.strip() for x in custom.split(",") if x.strip()]
+        if ingredients and st.button("Find Cocktails", type="primary"):
+            with st.spinner("Finding perfect matches…"):
+                _push_history(", ".join(ingredients))
+                _show_results(_vector_search, _prefs(ingredients=ingredients), top_k, sim_thresh)
+
+    # ----------------- MODE: Style (vector) -----------------
+    elif mode == "🎭 By Style/Mood":
+        st.subheader("Find by Style/Mood")
+        styles = st.multiselect("Pick your vibe", STYLE_OPTIONS, default=["refreshing"])
+        if styles and st.button("Find Cocktails", type="primary"):
+            with st.spinner("Finding your mood…"):
+                _push_history("style: " + ", ".join(styles))
+                _show_results(_vector_search, _prefs(style=styles), top_k, sim_thresh)
+
+    # ----------------- MODE: Occasion (vector) --------------
+    elif mode == "🎉 By Occasion":
+        st.subheader("Find by Occasion")
+        occasion = st.selectbox(
+            "Occasion",
+            OCCASION_OPTIONS,
+            index=1
+        )
+        if occasion and st.button("Find Cocktails", type="primary"):
+            with st.spinner("Mixing for the moment…"):
+                _push_history(f"occasion: {occasion}")
+                _show_results(_vector_search, _prefs(occasion=occasion), top_k, sim_thresh)
+
+    # ----------------- MODE: Mixed (vector) -----------------
+    elif mode == "🎲 Mixed Preferences":
+        st.subheader("Mix & Match")
+        c1, c2 = st.columns(2)
+        with c1:
+            ing = st.multiselect("Ingredients", COMMON_INGREDIENTS)
+            sty = st.multiselect("Style", MIX_STYLE_OPTIONS)
+        with c2:
+            occ = st.selectbox("Occasion", MIX_OCCASION_OPTIONS)
+            alc = st.selectbox("Alcoholic preference", ALCOHOL_OPTIONS)
+        if any([ing, sty, occ, alc]) and st.button("Find My Perfect Cocktail", type="primary"):
+            with st.spinner("Analyzing preferences…"):
+                parts = [", ".join(ing), ", ".join(sty), occ, alc]
+                _push_history("mix: " + "; ".join(p for p in parts if p))
+                _show_results(_vector_search, _prefs(ing, sty, occ, alc), top_k, sim_thresh)
+
+    # ----------------- MODE: Category (non-vector) ----------
+    elif mode == "📂 By Category":
+        st.subheader("Browse by Category")
+        cat = st.selectbox(
+            "Choose a category",
+            CATEGORY_OPTIONS,
+        )
+        if cat:
+            with st.spinner("Loading category…"):
+                _push_history(f"category: {cat}")
+                _show_results(_by_cat, cat, top_k)
+
+    # ----------------- MODE: Random (non-vector) ------------
+    elif mode == "🎰 Random Discovery":
+        st.subheader("Surprise Me")
+        st.caption("Let AI inspire you with random cocktails.")
+        if st.button("🎲 Roll", type="primary"):
+            with st.spinner("Shuffling…"):
+                _push_history("random")
+                st.session_state["random_nonce"] = st.session_state.get("random_nonce", 0) + 1
+                _show_results(_random, top_k, st.session_state["random_nonce"])
+
+    # The rest of the page (export, favorites) reads the results too
+    if st.session_state["results"] != before:
+        st.rerun()
+
+    # ----------------- Results ------------------------------
+    # A single slot so a new result set replaces the old one in place
+    results_slot = st.empty()
+    if st.session_state["results"]:
+        with results_slot.container():
+            st.divider()
+            st.subheader(f"🍸 Results ({len(st.session_state['results'])})")
+            render_cards(st.session_state["results"], per_row=per_row, compact=compact)
 
 # =========================================================
 # Main app
 # =========================================================
 def main():
     _ensure_state()
+    # Streamlit drops elements that a rerun doesn't emit, so the stylesheet is
+    # sent every run; only building the string is cached.
+    st.markdown(_css(CSS_VERSION), unsafe_allow_html=True)
 
     # Header
     st.markdown('<h1 class="main-header">🍹 Cocktail Studio</h1>', unsafe_allow_html=True)
-    st.markdown('<div class="subtitle">Discover, filter, and save your next favorite drink!</div>', unsafe_allow_html=True)
+    st.caption("Discover, filter, and save your next favorite drink!")
     st.write("")
 
     # Sidebar controls
@@ -260,15 +516,7 @@ def main():
         st.header("🎯 Preferences")
         mode = st.selectbox(
             "Explore mode",
-            [
-                "🔍 Search by Name",
-                "🥃 By Ingredients",
-                "🎭 By Style/Mood",
-                "🎉 By Occasion",
-                "🎲 Mixed Preferences",
-                "📂 By Category",
-                "🎰 Random Discovery",
-            ],
+            MODES,
         )
 
         st.divider()
@@ -283,23 +531,20 @@ def main():
 
         st.divider()
         st.caption("Quick ingredients")
-        quick = st.multiselect("Pick a few", common_ingredients())
+        quick = st.multiselect("Pick a few", COMMON_INGREDIENTS)
 
         # Search history chips
         if st.session_state["history"]:
             st.caption("Recent searches")
-            hist_cols = st.columns(min(4, len(st.session_state["history"])))
-            for i, h in enumerate(st.session_state["history"]):
+            recent = list(reversed(st.session_state["history"]))  # newest first
+            hist_cols = st.columns(min(4, len(recent)))
+            for i, h in enumerate(recent):
                 with hist_cols[i % len(hist_cols)]:
                     if st.button(f"🕘 {h}", key=f"h-{i}"):
                         # re-run a name search quickly
                         _push_history(h)  # keep it at top
-                        try:
-                            rows = get_recommender().get_cocktail_by_name(h)
-                            st.session_state["results"] = [get_recommender().format_result(r) for r in rows]
+                        if _show_results(_by_name, h):
                             st.session_state["last_mode"] = "🔍 Search by Name"
-                        except Exception as e:
-                            st.error(f"History search failed: {e}")
 
         if st.button("Reset All", type="secondary", use_container_width=True):
             st.session_state.clear()
@@ -307,7 +552,7 @@ def main():
 
     # Instantiate recommender once
     try:
-        recommender = get_recommender()
+        get_recommender()
     except Exception as e:
         st.error(f"Failed to initialize the recommender.\n\n{e}")
         st.stop()
@@ -321,112 +566,7 @@ def main():
     left, right = st.columns([2.6, 1.0], vertical_alignment="top")
 
     with left:
-        # ----------------- MODE: Search by Name -----------------
-        if mode == "🔍 Search by Name":
-            st.subheader("Search by Name")
-            name = st.text_input("Type a cocktail name", placeholder="e.g., Margarita, Mojito, Negroni")
-            if name:
-                with st.spinner("Searching…"):
-                    _push_history(name.strip())
-                    rows = recommender.get_cocktail_by_name(name)
-                    st.session_state["results"] = [recommender.format_result(r) for r in rows]
-
-        # ----------------- MODE: Ingredients (vector) -----------
-        elif mode == "🥃 By Ingredients":
-            st.subheader("Find by Ingredients")
-            col_a, col_b = st.columns([2,3])
-            with col_a:
-                custom = st.text_input("Add custom ingredients", placeholder="comma-separated, e.g., gin, lemon")
-            ingredients = quick.copy()
-            if custom:
-                ingredients += [x.strip() for x in custom.split(",") if x.strip()]
-            if ingredients and st.button("Find Cocktails", type="primary"):
-                with st.spinner("Finding perfect matches…"):
-                    text = f"cocktail with {' and '.join(ingredients)}"
-                    _push_history(", ".join(ingredients))
-                    emb = recommender.get_user_preferences_embedding([text])
-                    rows = recommender.search_similar_cocktails(emb, limit=top_k, threshold=sim_thresh)
-                    st.session_state["results"] = [recommender.format_result(r) for r in rows]
-
-        # ----------------- MODE: Style (vector) -----------------
-        elif mode == "🎭 By Style/Mood":
-            st.subheader("Find by Style/Mood")
-            style_opts = ["sweet","sour","bitter","strong","light","fruity","creamy","refreshing","exotic","classic","tropical"]
-            styles = st.multiselect("Pick your vibe", style_opts, default=["refreshing"])
-            if styles and st.button("Find Cocktails", type="primary"):
-                with st.spinner("Finding your mood…"):
-                    text = f"cocktail that is {' and '.join(styles)}"
-                    _push_history("style: " + ", ".join(styles))
-                    emb = recommender.get_user_preferences_embedding([text])
-                    rows = recommender.search_similar_cocktails(emb, limit=top_k, threshold=sim_thresh)
-                    st.session_state["results"] = [recommender.format_result(r) for r in rows]
-
-        # ----------------- MODE: Occasion (vector) --------------
-        elif mode == "🎉 By Occasion":
-            st.subheader("Find by Occasion")
-            occasion = st.selectbox(
-                "Occasion",
-                ["", "party", "date night", "summer evening", "winter warmer", "brunch", "after dinner", "celebration", "relaxing at home"],
-                index=1
-            )
-            if occasion and st.button("Find Cocktails", type="primary"):
-                with st.spinner("Mixing for the moment…"):
-                    text = f"cocktail for {occasion}"
-                    _push_history(f"occasion: {occasion}")
-                    emb = recommender.get_user_preferences_embedding([text])
-                    rows = recommender.search_similar_cocktails(emb, limit=top_k, threshold=sim_thresh)
-                    st.session_state["results"] = [recommender.format_result(r) for r in rows]
-
-        # ----------------- MODE: Mixed (vector) -----------------
-        elif mode == "🎲 Mixed Preferences":
-            st.subheader("Mix & Match")
-            c1, c2 = st.columns(2)
-            with c1:
-                ing = st.multiselect("Ingredients", common_ingredients())
-                sty = st.multiselect("Style", ["sweet","sour","strong","light","fruity","refreshing"])
-            with c2:
-                occ = st.selectbox("Occasion", ["", "party","date night","summer","winter","brunch"])
-                alc = st.selectbox("Alcoholic preference", ["", "Alcoholic","Non alcoholic","Optional alcohol"])
-            if any([ing, sty, occ, alc]) and st.button("Find My Perfect Cocktail", type="primary"):
-                with st.spinner("Analyzing preferences…"):
-                    parts: List[str] = []
-                    if ing: parts.append(f"contains {' and '.join(ing)}")
-                    if sty: parts.append(f"is {' and '.join(sty)}")
-                    if occ: parts.append(f"perfect for {occ}")
-                    if alc: parts.append(f"is {alc}")
-                    _push_history("mix: " + "; ".join(parts))
-                    emb = recommender.get_user_preferences_embedding(parts)
-                    rows = recommender.search_similar_cocktails(emb, limit=top_k, threshold=sim_thresh)
-                    st.session_state["results"] = [recommender.format_result(r) for r in rows]
-
-        # ----------------- MODE: Category (non-vector) ----------
-        elif mode == "📂 By Category":
-            st.subheader("Browse by Category")
-            cat = st.selectbox(
-                "Choose a category",
-                ["", "Ordinary Drink", "Cocktail", "Shot", "Coffee / Tea", "Homemade Liqueur", "Punch / Party Drink", "Beer", "Soft Drink"]
-            )
-            if cat:
-                with st.spinner("Loading category…"):
-                    _push_history(f"category: {cat}")
-                    rows = recommender.get_cocktail_by_category(cat, limit=top_k)
-                    st.session_state["results"] = [recommender.format_result(r) for r in rows]
-
-        # ----------------- MODE: Random (non-vector) ------------
-        elif mode == "🎰 Random Discovery":
-            st.subheader("Surprise Me")
-            st.caption("Let AI inspire you with random cocktails.")
-            if st.button("🎲 Roll", type="primary"):
-                with st.spinner("Shuffling…"):
-                    _push_history("random")
-                    rows = recommender.get_random_cocktails(limit=top_k)
-                    st.session_state["results"] = [recommender.format_result(r) for r in rows]
-
-        # ----------------- Results ------------------------------
-        if st.session_state["results"]:
-            st.divider()
-            st.subheader(f"🍸 Results ({len(st.session_state['results'])})")
-            render_cards(st.session_state["results"], per_row=per_row, compact=compact)
+        results_panel(mode, top_k, sim_thresh, per_row, compact, quick)
 
     with right:
         st.subheader("📊 Controls")
@@ -438,19 +578,13 @@ def main():
         st.subheader("🧰 Utilities")
         if st.session_state["results"]:
             # lightweight CSV export of names + similarity
-            import pandas as pd
-            simple = [
-                {
-                    "name": r.get("name",""),
-                    "similarity": r.get("similarity",""),
-                    "category": r.get("category",""),
-                    "alcoholic": r.get("alcoholic",""),
-                } for r in st.session_state["results"]
-            ]
-            df = pd.DataFrame(simple)
+            rows_key = tuple(
+                (r.get("name",""), r.get("similarity",""), r.get("category",""), r.get("alcoholic",""))
+                for r in st.session_state["results"]
+            )
             st.download_button(
                 "⬇️ Export results (.csv)",
-                df.to_csv(index=False).encode(),
+                _results_csv(rows_key),
                 file_name="cocktails_results.csv",
                 use_container_width=True,
             )
@@ -479,11 +613,10 @@ def main():
                 st.write("•", fav)
 
     if st.session_state.get("show_favs") and st.session_state["favorites"] and st.session_state["results"]:
-        fav_filter = {n for n in st.session_state["favorites"]}
-        favs = [r for r in st.session_state["results"] if r.get("name") in fav_filter]
+        favs = [r for r in st.session_state["results"] if r.get("name") in st.session_state["favorites"]]
         st.divider()
         st.subheader(f"💖 Favorites in this result set ({len(favs)})")
-        render_cards(favs, per_row=per_row, compact=True)
+        render_cards(favs, per_row=per_row, compact=True, key_prefix="favs-")
 
 if __name__ == "__main__":
     main()
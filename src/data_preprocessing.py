@@ -1,20 +1,153 @@
+import ast
+import json
+import numpy as np
 import pandas as pd
 import os
+import torch
+from typing import NamedTuple
 from dotenv import load_dotenv
 from database_setup import DBSetup
 from sentence_transformers import SentenceTransformer
 
+try:
+    import faiss
+except ImportError:
+    faiss = None
+
 load_dotenv()
 
+FAISS_INDEX_PATH = os.getenv('FAISS_INDEX_PATH', 'data/cocktails.faiss')
+
+# Columns clean_data knows about, for both the Kaggle and TheCocktailDB layouts
+USED_COLUMNS = {
+    'name', 'strDrink', 'alcoholic', 'strAlcoholic', 'category', 'strCategory',
+    'glassType', 'strGlass', 'instructions', 'strInstructions',
+    'ingredients', 'ingredientMeasures', 'strIBA',
+}
+
+class Schema(NamedTuple):
+    """
+    Source column names for one dataset layout (Kaggle or TheCocktailDB)
+    """
+    name: str
+    alcoholic: str
+    category: str
+    glass: str
+    instructions: str
+
+
+def detect_schema(columns) -> Schema:
+    columns = set(columns)
+    return Schema(
+        name='name' if 'name' in columns else 'strDrink',
+        alcoholic='alcoholic' if 'alcoholic' in columns else 'strAlcoholic',
+        category='category' if 'category' in columns else 'strCategory',
+        glass='glassType' if 'glassType' in columns else 'strGlass',
+        instructions='instructions' if 'instructions' in columns else 'strInstructions',
+    )
+
+
+def is_used_column(col):
+    return col in USED_COLUMNS or col.startswith(('strIngredient', 'strMeasure'))
+
+
+def _literal_list(text):
+    try:
+        parsed = ast.literal_eval(text)
+        return list(parsed) if isinstance(parsed, (list, tuple)) else [parsed]
+    except (ValueError, SyntaxError):
+        return [text]
+
+
+def _json_list(text):
+    try:
+        parsed = json.loads(text)
+        return parsed if isinstance(parsed, list) else [parsed]
+    except ValueError:
+        return _literal_list(text)
+
+
+def parse_list_column(series):
+    text = series.astype(str).str.strip()
+    is_list = text.str.startswith('[') & text.str.endswith(']')
+
+    # json.loads is C-implemented; probe one value so a column of Python
+    # reprs (single quotes) goes straight to literal_eval instead of
+    # raising a JSON error per row
+    parse = _literal_list
+    bracketed = text[is_list]
+    if len(bracketed):
+        try:
+            json.loads(bracketed.iloc[0])
+            parse = _json_list
+        except ValueError:
+            pass
+
+    parsed = [parse(t) if flag else ([t] if t else []) for t, flag in zip(text, is_list)]
+    return pd.Series(parsed, index=series.index, dtype=object)
+
+
+def is_blank(values):
+    text = values.astype(str).str.strip()
+    return (text == '') | text.str.lower().isin(['none', 'nan'])
+
+
+def ingredient_lines(ingredients, measures):
+    # Pair each ingredient with the measure at the same list position
+    ing = ingredients.explode()
+    msr = measures.explode()
+    pairs = pd.DataFrame({
+        'row': ing.index, 'pos': ing.groupby(level=0).cumcount().values, 'ing': ing.values,
+    }).merge(
+        pd.DataFrame({'row': msr.index, 'pos': msr.groupby(level=0).cumcount().values, 'msr': msr.values}),
+        on=['row', 'pos'], how='left',
+    )
+    pairs = pairs[~is_blank(pairs['ing'])]
+    ing_txt = pairs['ing'].astype(str)
+    msr_txt = pairs['msr'].astype(str)
+    lines = (' - ' + ing_txt).where(is_blank(pairs['msr']), ' - ' + msr_txt + ' ' + ing_txt) + '\n'
+    return lines.groupby(pairs['row'], sort=False).agg(''.join).reindex(ingredients.index, fill_value='')
+
+
+def create_recipe(data, schema: Schema):
+    """
+    Full recipe text for every row, built with column-wise string ops
+    """
+    def col(name):
+        return data[name].astype(str) if name in data.columns else ''
+
+    recipe = ('Drink: ' + col(schema.name) + '\nCategory: ' + col(schema.category)
+              + '\nType: ' + col(schema.alcoholic) + '\nGlass: ' + col(schema.glass) + '\n')
+    if schema.instructions in data.columns:
+        instructions = data[schema.instructions]
+        recipe += ('Instructions: ' + instructions.astype(str) + '\n').where(instructions.astype(bool), '')
+    return recipe + 'Ingredients:\n' + ingredient_lines(data['_ingredients_parsed'], data['_measures_parsed'])
+
+
+def get_ingredients_list(parsed):
+    """
+    Comma-joined, non-blank ingredient names for a column of parsed lists
+    """
+    # explode -> filter -> join per original row, all as column operations
+    exploded = parsed.explode()
+    names = exploded.astype(str).str.strip()
+    joined = names[~is_blank(exploded)].groupby(level=0, sort=False).agg(', '.join)
+    return joined.reindex(parsed.index, fill_value='')
+
+
 class DataPreprocessor:
     def __init__(self):
         self.model_name = os.getenv('MODEL_NAME', 'all-MiniLM-L6-v2')
-        self.model = SentenceTransformer(self.model_name)
+        device = 'cuda' if torch.cuda.is_available() else 'cpu'
+        self.model = SentenceTransformer(self.model_name, device=device)
         self.db_setup = DBSetup()
 
     def load_data(self, data_path):
         try:
-            data = pd.read_csv(data_path)
+            # Read the header first so only the columns clean_data uses are parsed
+            header = pd.read_csv(data_path, nrows=0).columns
+            usecols = [c for c in header if is_used_column(c)]
+            data = pd.read_csv(data_path, engine='pyarrow', usecols=usecols, dtype='string[pyarrow]')
             print(f"Data loaded successfully from {data_path}")
             return data
         except Exception as e:
@@ -22,169 +155,135 @@ class DataPreprocessor:
             return None
 
     def clean_data(self, data):
-        self.name_col = 'name' if 'name' in data.columns else 'strDrink'
-        self.alcoholic_col = 'alcoholic' if 'alcoholic' in data.columns else 'strAlcoholic'
-        self.category_col = 'category' if 'category' in data.columns else 'strCategory'
-        self.glass_col = 'glassType' if 'glassType' in data.columns else 'strGlass'
-        self.instructions_col = 'instructions' if 'instructions' in data.columns else 'strInstructions'
+        """
+        Returns the cleaned frame together with the detected Schema
+        """
+        schema = detect_schema(data.columns)
         print(f'Detected columns: {data.columns.tolist()}')
 
         # Drop duplicated drink
-        if self.name_col in data.columns:
-            data = data.drop_duplicates(subset=[self.name_col])
+        if schema.name in data.columns:
+            data = data.drop_duplicates(subset=[schema.name])
 
         data = data.fillna('')
         
-        data['combined_text'] = ''
-        if self.name_col in data.columns:
-            data['combined_text'] += data[self.name_col].astype(str) + ' '
-        if self.category_col in data.columns:
-            data['combined_text'] += data[self.category_col].astype(str) + ' '
-        if self.alcoholic_col in data.columns:
-            data['combined_text'] += data[self.alcoholic_col].astype(str) + ' '
-        if self.glass_col in data.columns:
-            data['combined_text'] += data[self.glass_col].astype(str) + ' '
-
+        text_cols = [c for c in (schema.name, schema.category, schema.alcoholic, schema.glass) if c in data.columns]
         if 'ingredients' in data.columns:
-            data['combined_text'] += data['ingredients'].astype(str) + ' '
+            text_cols.append('ingredients')
+        else:
+            text_cols += [c for c in data.columns if c.startswith('strIngredient')]
+        if schema.instructions in data.columns:
+            text_cols.append(schema.instructions)
+
+        # Concatenate and squeeze whitespace as Arrow string kernels, so the
+        # text never round-trips through Python str objects
+        if text_cols:
+            arrow = [data[c].astype('string[pyarrow]') for c in text_cols]
+            combined = arrow[0].str.cat(arrow[1:], sep=' ', na_rep='')
+            data['combined_text'] = combined.str.replace(r'\s+', ' ', regex=True).str.strip()
         else:
-            ingredient_cols = [c for c in data.columns if c.startswith('strIngredient')]
-            for col in ingredient_cols:
-                data['combined_text'] += data[col].astype(str) + ' '
+            data['combined_text'] = ''
 
-        if self.instructions_col in data.columns:
-            data['combined_text'] += data[self.instructions_col].astype(str) + ' '
+        # Parse the list-valued columns once, for both dataset layouts
+        if 'ingredients' in data.columns:
+            data['_ingredients_parsed'] = parse_list_column(data['ingredients'])
+            if 'ingredientMeasures' in data.columns:
+                data['_measures_parsed'] = parse_list_column(data['ingredientMeasures'])
+            else:
+                data['_measures_parsed'] = [[] for _ in range(len(data))]
+        else:
+            data['_ingredients_parsed'] = data.reindex(
+                columns=[f'strIngredient{i}' for i in range(1, 16)], fill_value=''
+            ).values.tolist()
+            data['_measures_parsed'] = data.reindex(
+                columns=[f'strMeasure{i}' for i in range(1, 16)], fill_value=''
+            ).values.tolist()
+        data['_ingredients_text'] = get_ingredients_list(data['_ingredients_parsed'])
+        data['_recipe'] = create_recipe(data, schema)
 
-        data['combined_text'] = data['combined_text'].str.replace(r'\s+', ' ', regex=True).str.strip()
         print(f'Data cleaned. Sample combined text: {data["combined_text"].iloc[0][:100]}...')
-        return data
+        return data, schema
 
     def generate_embeddings(self, texts):
-        embeddings = self.model.encode(texts, show_progress_bar=True)
+        # Large batches amortize per-batch overhead; unit-length vectors keep
+        # cosine similarity equal to the inner product. encode() already sorts
+        # inputs by length before batching (and restores the order), so padding
+        # per batch stays minimal without pre-sorting here.
+        embeddings = self.model.encode(
+            texts,
+            batch_size=128,
+            convert_to_numpy=True,
+            normalize_embeddings=True,
+            show_progress_bar=True,
+        )
         print(f'Generated {len(embeddings)} embeddings.')
         return embeddings
 
-    def create_recipe(self, row):
-        recipe = f'Drink: {row.get(self.name_col, "")}\n'
-        recipe += f'Category: {row.get(self.category_col, "")}\n'
-        recipe += f'Type: {row.get(self.alcoholic_col, "")}\n'
-        recipe += f'Glass: {row.get(self.glass_col, "")}\n'
-
-        if row.get(self.instructions_col):
-            recipe += f'Instructions: {row[self.instructions_col]}\n'
-        
-        recipe += 'Ingredients:\n'
-        if 'ingredients' in row and row['ingredients']:
-            try:
-                import ast
-                ingredients_str = row['ingredients']
-
-                if ingredients_str.startswith('[') and ingredients_str.endswith(']'):
-                    ingredients = ast.literal_eval(ingredients_str)
-                else:
-                    ingredients = [ingredients_str]
-
-                measures = []
-                if 'ingredientMeasures' in row and row['ingredientMeasures']:
-                    measures_str = row['ingredientMeasures']
-                    if measures_str.startswith('[') and measures_str.endswith(']'):
-                        measures = ast.literal_eval(measures_str)
-                    else:
-                        measures = [measures_str]
-
-                for i, ingredient in enumerate(ingredients):
-                    if ingredient and str(ingredient).strip() and str(ingredient).strip().lower() != 'none':
-                        if i < len(measures) and measures[i] and str(measures[i]).strip() and str(measures[i]).strip().lower() != 'none':
-                            recipe += f' - {measures[i]} {ingredient}\n'
-                        else:
-                            recipe += f' - {ingredient}\n'
-            except Exception as e:
-                recipe += f"- {row['ingredients']}\n"
-
-        else:
-            for i in range(1, 16):
-                ingredient = row.get(f'strIngredient{i}')
-                measure = row.get(f'strMeasure{i}')
-                if ingredient and str(ingredient).strip() and str(ingredient).strip().lower() != 'none':
-                    if measure and str(measure).strip() and str(measure).strip().lower() != 'none':
-                        recipe += f' - {measure} {ingredient}\n'
-                    else:
-                        recipe += f' - {ingredient}\n'
-        return recipe
-    
-    def get_ingredients_list(self, row):
-        ingredients = []
-        
-        if 'ingredients' in row and row['ingredients']:
-            try:
-                import ast
-                ingredients_str = row['ingredients']
-                
-                if ingredients_str.startswith('[') and ingredients_str.endswith(']'):
-                    ingredients_list = ast.literal_eval(ingredients_str)
-                    for ingredient in ingredients_list:
-                        if ingredient and str(ingredient).strip() and str(ingredient).strip().lower() != 'none':
-                            ingredients.append(str(ingredient).strip())
-                else:
-                    if ingredients_str.strip():
-                        ingredients.append(ingredients_str.strip())
-            except Exception as e:
-                if row['ingredients'].strip():
-                    ingredients.append(row['ingredients'].strip())
-        else:
-            for i in range(1, 16):
-                ingredient = row.get(f'strIngredient{i}')
-                if ingredient and str(ingredient).strip() and str(ingredient).strip() != 'nan':
-                    ingredients.append(str(ingredient).strip())
-        
-        return ', '.join(ingredients)
-
-    def store_cocktails(self, data):
+    def store_cocktails(self, data, schema: Schema):
         try:
-            conn = self.db_setup.get_connection()
-            cursor = conn.cursor()
-
-            cursor.execute("DELETE FROM cocktails")
-
-            print(f'Generating and storing embeddings for {len(data)} cocktails...')
-            embeddings = self.generate_embeddings(data['combined_text'].tolist())
-
-            for idx, (_, row) in enumerate(data.iterrows()):
-                emb = embeddings[idx]
-
-                name = row.get(self.name_col, '')
-                ingredients = self.get_ingredients_list(row)
-                recipe = self.create_recipe(row)
-                alcoholic = row.get(self.alcoholic_col, '')
-                category = row.get(self.category_col, '')
-                glass = row.get(self.glass_col, '')
-                iba = row.get('strIBA', '') 
-
-                cursor.execute("""
-                   INSERT INTO cocktails (name, ingredients, recipe, glass, category, iba, alcoholic, embedding)            
-                   VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
-                """, (name, ingredients, recipe, glass, category, iba, alcoholic, emb.tolist()))
-
-                if (idx + 1) % 100 == 0:
-                    print(f'Inserted {idx + 1} records...')
-            
-            conn.commit()
-            cursor.close()
-            conn.close()
+            # The pooled connection commits on success and rolls back on error
+            with self.db_setup.get_connection() as conn:
+                with conn.cursor() as cursor:
+                    cursor.execute("DELETE FROM cocktails")
+
+                    print(f'Generating and storing embeddings for {len(data)} cocktails...')
+                    embeddings = self.generate_embeddings(data['combined_text'].tolist())
+
+                    # Fixed column order, so plain tuples can be unpacked positionally
+                    frame = data.reindex(columns=[
+                        schema.name, schema.category, schema.alcoholic, schema.glass,
+                        'strIBA', '_ingredients_text', '_recipe',
+                    ], fill_value='')
+
+                    # Reserve ids up front: COPY can't RETURN them, and the FAISS index
+                    # is keyed by id
+                    cursor.execute(
+                        "SELECT nextval(pg_get_serial_sequence('cocktails', 'id')) FROM generate_series(1, %s)",
+                        (len(frame),),
+                    )
+                    ids = [row[0] for row in cursor.fetchall()]
+
+                    rows = (
+                        (id_, name, ingredients, recipe, glass, category, iba, alcoholic, emb)
+                        for id_, emb, (name, category, alcoholic, glass, iba, ingredients, recipe)
+                        in zip(ids, embeddings, frame.itertuples(index=False, name=None))
+                    )
+                    # Same transaction as the DELETE, so a failed load keeps the old
+                    # rows; the vector index is rebuilt and tuned after the COPY
+                    self.db_setup.bulk_load_cocktails(rows, with_ids=True, cursor=cursor)
+                    print(f'Inserted {len(ids)} records.')
             print('✅ All cocktails stored successfully.')
+
+            self.build_faiss_index(embeddings, ids)
         except Exception as e:
             print(f'❌ Error storing cocktails: {e}')
-            # Rollback in case of error
-            if 'conn' in locals():
-                conn.rollback()
-                conn.close()
+
+    def build_faiss_index(self, embeddings, ids):
+        """
+        Write an in-memory FAISS index keyed by cocktail id next to the dataset
+        """
+        if faiss is None:
+            # A stale index would shadow the rows just written
+            if os.path.exists(FAISS_INDEX_PATH):
+                os.remove(FAISS_INDEX_PATH)
+            print('faiss not installed; similarity search will use pgvector.')
+            return
+        try:
+            embs = np.ascontiguousarray(embeddings, dtype='float32')
+            faiss.normalize_L2(embs)
+            index = faiss.IndexIDMap2(faiss.IndexFlatIP(embs.shape[1]))
+            index.add_with_ids(embs, np.asarray(ids, dtype='int64'))
+            faiss.write_index(index, FAISS_INDEX_PATH)
+            print(f'✅ FAISS index with {index.ntotal} vectors written to {FAISS_INDEX_PATH}')
+        except Exception as e:
+            print(f'❌ Error building FAISS index: {e}')
 
     def run(self, data_path):
         data = self.load_data(data_path)
         if data is None:
             return
-        cleaned_data = self.clean_data(data)
-        self.store_cocktails(cleaned_data)
+        cleaned_data, schema = self.clean_data(data)
+        self.store_cocktails(cleaned_data, schema)
 
 
 if __name__ == "__main__":
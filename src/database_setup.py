@@ -1,6 +1,15 @@
 import os
-import psycopg2
-from psycopg2.extensions import ISOLATION_LEVEL_AUTOCOMMIT
+import asyncio
+import atexit
+import struct
+import threading
+from contextlib import asynccontextmanager
+import numpy as np
+import psycopg
+from psycopg.adapt import Dumper
+from psycopg.conninfo import make_conninfo
+from psycopg.pq import Format
+from psycopg_pool import AsyncConnectionPool, ConnectionPool
 from dotenv import load_dotenv
 
 try:
@@ -8,6 +17,98 @@ try:
 except Exception as e:
     print(f"Error loading .env file: {e}")
 
+VECTOR_INDEX = 'cocktails_embedding_idx'
+# Embeddings are stored unit-length, so inner product ranks like cosine
+VECTOR_OPCLASS = 'halfvec_ip_ops'
+
+def hnsw_params(n_rows):
+    """
+    HNSW build/search parameters bucketed by table size
+    """
+    if n_rows < 100_000:
+        return {'m': 16, 'ef_construction': 64, 'ef_search': 40}
+    if n_rows < 1_000_000:
+        return {'m': 24, 'ef_construction': 128, 'ef_search': 100}
+    return {'m': 32, 'ef_construction': 200, 'ef_search': 200}
+
+# Column order of rows passed to DBSetup.bulk_load_cocktails
+COPY_COLUMNS = ('name', 'ingredients', 'recipe', 'glass', 'category', 'iba', 'alcoholic', 'embedding')
+
+def vector_literal(emb):
+    """
+    pgvector text literal for an embedding. FP16 is what halfvec stores anyway,
+    and its shortest repr is about a third of the text of a float64 list.
+    """
+    if isinstance(emb, str):
+        return emb
+    return '[' + ','.join(map(str, np.asarray(emb, dtype=np.float16))) + ']'
+
+class HalfvecBinaryDumper(Dumper):
+    """
+    numpy arrays in pgvector's binary halfvec format: int16 dim, int16 unused,
+    then big-endian FP16 values. The parameter is sent untyped, so the query
+    must cast it (%s::halfvec).
+    """
+    format = Format.BINARY
+
+    def dump(self, obj):
+        values = np.asarray(obj, dtype='>f2').ravel()
+        return struct.pack('>hh', values.size, 0) + values.tobytes()
+
+def _configure(conn):
+    conn.adapters.register_dumper(np.ndarray, HalfvecBinaryDumper)
+
+async def _aconfigure(conn):
+    _configure(conn)
+
+# One pool per database per process, shared by every DBSetup instance
+_pools = {}
+_pools_lock = threading.Lock()
+
+def _get_pool(conninfo):
+    with _pools_lock:
+        pool = _pools.get(conninfo)
+        if pool is None:
+            pool = ConnectionPool(
+                conninfo,
+                min_size=2,
+                max_size=10,
+                kwargs={"prepare_threshold": 1},
+                configure=_configure,
+            )
+            atexit.register(pool.close)
+            _pools[conninfo] = pool
+        return pool
+
+# Async pools are bound to the event loop that opened them
+_async_pools = {}
+
+async def _get_async_pool(conninfo):
+    pools = _async_pools.setdefault(asyncio.get_running_loop(), {})
+    opening = pools.get(conninfo)
+    if opening is None:
+        async def _open():
+            pool = AsyncConnectionPool(
+                conninfo,
+                min_size=4,
+                max_size=20,
+                kwargs={"prepare_threshold": 1},
+                configure=_aconfigure,
+                open=False,
+            )
+            await pool.open()
+            return pool
+        # Concurrent first callers wait on the same open instead of racing
+        opening = pools[conninfo] = asyncio.ensure_future(_open())
+    return await opening
+
+async def close_async_pools():
+    """
+    Close the async pools opened on the running loop, e.g. before asyncio.run() returns
+    """
+    for opening in _async_pools.pop(asyncio.get_running_loop(), {}).values():
+        await (await opening).close()
+
 class DBSetup:
     def __init__(self):
         self.host = os.getenv("DB_HOST", "localhost")
@@ -18,14 +119,15 @@ class DBSetup:
 
     def create_database(self):
         try:
-            with psycopg2.connect(
-                database="postgres",
+            # CREATE DATABASE can't run inside a transaction block
+            with psycopg.connect(
+                dbname="postgres",
                 user=self.user,
                 password=self.password,
                 host=self.host,
-                port=self.port
+                port=self.port,
+                autocommit=True
             ) as conn:
-                conn.set_isolation_level(ISOLATION_LEVEL_AUTOCOMMIT)
                 with conn.cursor() as cursor:
                     # Check if database exists
                     cursor.execute(
@@ -44,8 +146,8 @@ class DBSetup:
     
     def setup_pgvector(self):
         try:
-            with psycopg2.connect(
-                database=self.db_name,
+            with psycopg.connect(
+                dbname=self.db_name,
                 user=self.user,
                 password=self.password,
                 host=self.host,
@@ -54,6 +156,11 @@ class DBSetup:
                 with conn.cursor() as cursor:
                     # Enable pgvector extension
                     cursor.execute("CREATE EXTENSION IF NOT EXISTS vector")
+                    # Optional contrib extensions; the queries fall back without them
+                    # Page-level row sampling for random picks
+                    self._create_optional_extension(cursor, "tsm_system_rows")
+                    # Trigram indexes for substring name/category lookups
+                    has_trgm = self._create_optional_extension(cursor, "pg_trgm")
 
                     # Create cocktails table with vector embeddings
                     cursor.execute("""
@@ -66,32 +173,205 @@ class DBSetup:
                             category VARCHAR(100),
                             iba VARCHAR(100),
                             alcoholic VARCHAR(50),
-                            embedding vector(384)
+                            embedding halfvec(384)
                         )
                     """)
 
-                    # Create index for vector search
+                    self._migrate_embeddings(cursor)
+
+                    # Chosen index parameters, read back by the recommender
                     cursor.execute("""
-                        CREATE INDEX IF NOT EXISTS cocktails_embedding_idx 
-                        ON cocktails USING ivfflat (embedding vector_cosine_ops)
-                        WITH (lists = 100)
+                        CREATE TABLE IF NOT EXISTS cocktail_index_config (
+                            index_name VARCHAR(100) PRIMARY KEY,
+                            n_rows BIGINT NOT NULL,
+                            m INTEGER NOT NULL,
+                            ef_construction INTEGER NOT NULL,
+                            ef_search INTEGER NOT NULL,
+                            updated_at TIMESTAMPTZ DEFAULT now()
+                        )
                     """)
 
+                    # ILIKE '%...%' can use these; a btree on lower() cannot
+                    if has_trgm:
+                        cursor.execute("""
+                            CREATE INDEX IF NOT EXISTS cocktails_name_trgm_idx
+                            ON cocktails USING gin (name gin_trgm_ops)
+                        """)
+                        cursor.execute("""
+                            CREATE INDEX IF NOT EXISTS cocktails_category_trgm_idx
+                            ON cocktails USING gin (category gin_trgm_ops)
+                        """)
+
+                    self._build_vector_index(cursor)
+
                 conn.commit()
                 print("✅ pgvector extension and cocktails table set up successfully")
                     
         except Exception as e:
             print(f"Error setting up pgvector: {e}")
     
-    def get_connection(self):
-        return psycopg2.connect(
-            database=self.db_name,
+    @staticmethod
+    def _create_optional_extension(cursor, name):
+        # Savepoint so a missing or forbidden extension doesn't abort the
+        # setup transaction
+        try:
+            with cursor.connection.transaction():
+                cursor.execute(f"CREATE EXTENSION IF NOT EXISTS {name}")
+            return True
+        except (psycopg.errors.FeatureNotSupported,
+                psycopg.errors.UndefinedFile,
+                psycopg.errors.InsufficientPrivilege) as e:
+            print(f"Extension {name} is not available, skipping: {e}")
+            return False
+
+    def bulk_load_cocktails(self, rows_iter, with_ids=False, cursor=None, rebuild_index=True):
+        """
+        Stream rows into cocktails with COPY, far cheaper than INSERTs for wide rows.
+        Rows follow COPY_COLUMNS, prefixed by an explicit id when with_ids is set;
+        embeddings may be arrays, lists or vector literals. Pass a cursor to load
+        inside the caller's transaction. Returns the number of rows written.
+
+        By default the HNSW index is dropped for the load, then rebuilt with
+        parameters for the new row count and the table re-analyzed; the drop
+        blocks readers until the transaction commits. Pass rebuild_index=False
+        for small batches, which the existing index then absorbs row by row.
+        A FAISS index file is not rewritten; the recommender notices the new rows
+        and rebuilds its in-memory index from the table.
+        """
+        if cursor is None:
+            with self.get_connection() as conn:
+                with conn.cursor() as cursor:
+                    return self.bulk_load_cocktails(rows_iter, with_ids, cursor, rebuild_index)
+
+        if rebuild_index:
+            # Building the graph once beats inserting every row into it
+            cursor.execute(f"DROP INDEX IF EXISTS {VECTOR_INDEX}")
+
+        columns = (('id',) if with_ids else ()) + COPY_COLUMNS
+        n_rows = 0
+        with cursor.copy(
+            f"COPY cocktails ({', '.join(columns)}) FROM STDIN WITH (FORMAT text)"
+        ) as copy:
+            for row in rows_iter:
+                copy.write_row((*row[:-1], vector_literal(row[-1])))
+                n_rows += 1
+
+        if rebuild_index:
+            self._build_vector_index(cursor)
+            # Fresh planner stats and reltuples for the recommender
+            cursor.execute("ANALYZE cocktails")
+        return n_rows
+
+    def tune_vector_index(self):
+        """
+        Re-pick the HNSW parameters for the current row count, e.g. after a load
+        """
+        try:
+            with self.get_connection() as conn:
+                with conn.cursor() as cursor:
+                    self._build_vector_index(cursor)
+                    # Fresh planner stats and reltuples for the recommender
+                    cursor.execute("ANALYZE cocktails")
+                conn.commit()
+        except Exception as e:
+            print(f"Error tuning vector index: {e}")
+
+    @staticmethod
+    def _migrate_embeddings(cursor):
+        """
+        Bring tables from earlier setups to unit-length halfvec(384) embeddings.
+        The index is rebuilt by _build_vector_index.
+        """
+        cursor.execute("""
+            SELECT format_type(atttypid, atttypmod) FROM pg_attribute
+            WHERE attrelid = 'cocktails'::regclass AND attname = 'embedding'
+        """)
+        is_vector = cursor.fetchone()[0].startswith('vector')
+        cursor.execute("SELECT indexdef FROM pg_indexes WHERE indexname = %s", (VECTOR_INDEX,))
+        existing = cursor.fetchone()
+        # Rows stored under vector(384) or cosine_ops weren't necessarily
+        # normalized; inner product equals cosine only on unit vectors
+        if not is_vector and not (existing and VECTOR_OPCLASS not in existing[0]):
+            return
+
+        # Dropped first so the rewrite doesn't maintain the old index row by row
+        cursor.execute(f"DROP INDEX IF EXISTS {VECTOR_INDEX}")
+        if is_vector:
+            # FP16 storage halves the bytes the index scan reads
+            cursor.execute("""
+                ALTER TABLE cocktails
+                ALTER COLUMN embedding TYPE halfvec(384)
+                USING l2_normalize(embedding)::halfvec(384)
+            """)
+            print("Converted cocktails.embedding to normalized halfvec(384)")
+        else:
+            cursor.execute("UPDATE cocktails SET embedding = l2_normalize(embedding)")
+            print("Normalized stored embeddings for inner-product search")
+
+    def _build_vector_index(self, cursor):
+        cursor.execute("SELECT COUNT(*) FROM cocktails")
+        n_rows = cursor.fetchone()[0]
+        params = hnsw_params(n_rows)
+
+        cursor.execute(
+            "SELECT m, ef_construction FROM cocktail_index_config WHERE index_name = %s",
+            (VECTOR_INDEX,)
+        )
+        stored = cursor.fetchone()
+        cursor.execute("SELECT indexdef FROM pg_indexes WHERE indexname = %s", (VECTOR_INDEX,))
+        existing = cursor.fetchone()
+
+        # Rebuild only when the bucket or operator class changed; this also
+        # replaces the untracked ivfflat index from earlier setups
+        if (not existing or VECTOR_OPCLASS not in existing[0]
+                or stored != (params['m'], params['ef_construction'])):
+            cursor.execute(f"DROP INDEX IF EXISTS {VECTOR_INDEX}")
+            cursor.execute(f"""
+                CREATE INDEX {VECTOR_INDEX}
+                ON cocktails USING hnsw (embedding {VECTOR_OPCLASS})
+                WITH (m = {params['m']}, ef_construction = {params['ef_construction']})
+            """)
+            print(f"Built HNSW index for {n_rows} rows: {params}")
+
+        cursor.execute("""
+            INSERT INTO cocktail_index_config (index_name, n_rows, m, ef_construction, ef_search)
+            VALUES (%s, %s, %s, %s, %s)
+            ON CONFLICT (index_name) DO UPDATE SET
+                n_rows = EXCLUDED.n_rows,
+                m = EXCLUDED.m,
+                ef_construction = EXCLUDED.ef_construction,
+                ef_search = EXCLUDED.ef_search,
+                updated_at = now()
+        """, (VECTOR_INDEX, n_rows, params['m'], params['ef_construction'], params['ef_search']))
+
+    def conninfo(self):
+        return make_conninfo(
+            dbname=self.db_name,
             user=self.user,
             password=self.password,
             host=self.host,
             port=self.port
         )
 
+    @asynccontextmanager
+    async def get_async_connection(self):
+        """
+        Async counterpart of get_connection, pooled per event loop
+        """
+        pool = await _get_async_pool(self.conninfo())
+        async with pool.connection() as conn:
+            yield conn
+
+    def get_connection(self):
+        """
+        Borrow a pooled connection; use as `with db.get_connection() as conn:`.
+        It commits on success, rolls back on error and goes back to the pool.
+        """
+        # Created on first use, so setup can still create the database first.
+        # Server-side prepare from the second execution skips the repeated
+        # parse/plan of the same few lookups.
+        return _get_pool(self.conninfo()).connection()
+
 if __name__ == "__main__":
     setup = DBSetup()
     setup.create_database()
@@ -18,51 +18,46 @@ def check_database():
         db = DBSetup()
         
         # Test connection
-        conn = db.get_connection()
-        cursor = conn.cursor()
-        
-        # Check if cocktails table exists
-        cursor.execute("""
-            SELECT EXISTS (
-                SELECT FROM information_schema.tables 
-                WHERE table_name = 'cocktails'
-            );
-        """)
-        table_exists = cursor.fetchone()[0]
-        
-        if not table_exists:
-            print("❌ Cocktails table doesn't exist")
-            print("Run: python database_setup.py")
-            return False
-        
-        print("✅ Cocktails table exists")
-        
-        # Check number of cocktails
-        cursor.execute("SELECT COUNT(*) FROM cocktails")
-        count = cursor.fetchone()[0]
-        print(f"📊 Found {count} cocktails in database")
-        
-        if count == 0:
-            print("❌ No cocktails in database")
-            print("Run: python data_processor.py")
-            return False
-        
-        # Check if embeddings exist
-        cursor.execute("SELECT COUNT(*) FROM cocktails WHERE embedding IS NOT NULL")
-        embedding_count = cursor.fetchone()[0]
-        print(f"🧠 {embedding_count} cocktails have embeddings")
-        
-        # Test a simple query
-        cursor.execute("SELECT name FROM cocktails LIMIT 3")
-        samples = cursor.fetchall()
-        print("📝 Sample cocktails:")
-        for sample in samples:
-            print(f"  - {sample[0]}")
-        
-        cursor.close()
-        conn.close()
-        
-        return count > 0 and embedding_count > 0
+        with db.get_connection() as conn, conn.cursor() as cursor:
+            # Check if cocktails table exists
+            cursor.execute("""
+                SELECT EXISTS (
+                    SELECT FROM information_schema.tables 
+                    WHERE table_name = 'cocktails'
+                );
+            """)
+            table_exists = cursor.fetchone()[0]
+        
+            if not table_exists:
+                print("❌ Cocktails table doesn't exist")
+                print("Run: python database_setup.py")
+                return False
+        
+            print("✅ Cocktails table exists")
+        
+            # Check number of cocktails
+            cursor.execute("SELECT COUNT(*) FROM cocktails")
+            count = cursor.fetchone()[0]
+            print(f"📊 Found {count} cocktails in database")
+        
+            if count == 0:
+                print("❌ No cocktails in database")
+                print("Run: python data_preprocessing.py")
+                return False
+        
+            # Check if embeddings exist
+            cursor.execute("SELECT COUNT(*) FROM cocktails WHERE embedding IS NOT NULL")
+            embedding_count = cursor.fetchone()[0]
+            print(f"🧠 {embedding_count} cocktails have embeddings")
+        
+            # Test a simple query
+            cursor.execute("SELECT name FROM cocktails LIMIT 3")
+            samples = cursor.fetchall()
+            print("📝 Sample cocktails:")
+            for sample in samples:
+                print(f"  - {sample[0]}")
+        
+            return count > 0 and embedding_count > 0
         
     except Exception as e:
         print(f"❌ Database error: {e}")
@@ -82,9 +77,8 @@ def test_recommender():
         
         if random_results:
             print(f"✅ Random query returned {len(random_results)} results")
-            for result in random_results:
-                cocktail = recommender.format_cocktail_result(result)
-                print(f"  - {cocktail['name']}")
+            for cocktail in random_results:
+                print(f"  - {cocktail.name}")
         else:
             print("❌ Random query returned no results")
             return False
@@ -95,9 +89,8 @@ def test_recommender():
         
         if ingredient_results:
             print(f"✅ Ingredient search returned {len(ingredient_results)} results")
-            for result in ingredient_results:
-                cocktail = recommender.format_cocktail_result(result)
-                print(f"  - {cocktail['name']} (Similarity: {cocktail.get('similarity', 'N/A')}%)")
+            for cocktail in ingredient_results:
+                print(f"  - {cocktail.name} (Similarity: {round(cocktail.similarity * 100, 1)}%)")
         else:
             print("❌ Ingredient search returned no results")
         
@@ -190,7 +183,7 @@ def main():
         print("\n💡 Next steps:")
         print("1. Configure .env file")
         print("2. Run: python database_setup.py")
-        print("3. Run: python data_processor.py")
+        print("3. Run: python data_preprocessing.py")
     elif not recommender_ok:
         print("\n💡 Next steps:")
         print("1. Check the error messages above")
@@ -84,6 +84,8 @@ def main():
         print('3. Then run: python src/database_setup.py')
         print('4. Then run: python src/data_preprocessing.py')
     print('4. Run: streamlit run src/app.py')
+    print('   (Loading your own data? DBSetup().bulk_load_cocktails(rows) streams rows with COPY')
+    print('    and rebuilds the vector index; the recommender picks the rows up from the table.)')
 
     print("\nVerifying installations...")
     try:
@@ -93,10 +95,10 @@ def main():
         print("❌ Streamlit not installed")
     
     try:
-        import psycopg2
-        print("✅ psycopg2 installed")
+        import psycopg
+        print("✅ psycopg installed")
     except ImportError:
-        print("❌ psycopg2 not installed")
+        print("❌ psycopg not installed")
     
     try:
         import sentence_transformers
@@ -1,83 +1,623 @@
 import os
+import asyncio
+import logging
+import threading
+import time
+import numpy as np
+from contextlib import nullcontext
+import psycopg
+import torch
+from dataclasses import dataclass, replace
+from psycopg.rows import class_row
+from collections import OrderedDict
 from dotenv import load_dotenv
-from database_setup import DBSetup
+from database_setup import DBSetup, VECTOR_INDEX, hnsw_params, vector_literal
 from sentence_transformers import SentenceTransformer
 
+try:
+    import faiss
+except ImportError:
+    faiss = None
+
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
+# Leave a core for the web server; a single inter-op thread avoids
+# oversubscription on the small single-query batches served here
+torch.set_num_threads(max(1, (os.cpu_count() or 1) - 1))
+try:
+    torch.set_num_interop_threads(1)
+except RuntimeError:
+    pass  # already fixed once torch has run parallel work
+
+EMBED_CACHE_SIZE = 4096
+FAISS_INDEX_PATH = os.getenv('FAISS_INDEX_PATH', 'data/cocktails.faiss')
+# Without an index file, build one from the table only for catalogs this big
+FAISS_MIN_ROWS = int(os.getenv('FAISS_MIN_ROWS', '1000000'))
+FAISS_GPU_MIN_ROWS = int(os.getenv('FAISS_GPU_MIN_ROWS', '1000000'))
+FAISS_IVF_MIN_ROWS = 100_000
+# How often to compare the table with the index, and the drift that rebuilds it
+FAISS_CHECK_SECONDS = 300
+FAISS_REBUILD_DELTA = 0.1
+MODEL_BACKEND = os.getenv('MODEL_BACKEND', 'torch')
+ONNX_MODEL_FILE = os.getenv('ONNX_MODEL_FILE', 'onnx/model_qint8_avx512_vnni.onnx')
+
+# Queries shared by the sync and async paths, executed with prepare=True so
+# each pooled connection parses and plans them once, on first use.
+# Stored and query embeddings are unit-length, so the negated inner product
+# (<#>) is the cosine similarity.
+# Nearest neighbours first, so the ORDER BY ... LIMIT runs as an HNSW index
+# scan, then the threshold on the already-computed similarity
+SEARCH_SQL = """
+    SELECT * FROM (
+        SELECT id, name, ingredients, recipe, glass, category, iba, alcoholic,
+            -(embedding <#> %s::halfvec) as similarity
+        FROM cocktails
+        ORDER BY embedding <#> %s::halfvec
+        LIMIT %s
+    ) nearest
+    WHERE similarity > %s
+    ORDER BY similarity DESC
+    LIMIT %s
+"""
+
+EF_SEARCH_SQL = "SELECT set_config('hnsw.ef_search', %s, false)"
+
+BY_IDS_SQL = """
+    SELECT id, name, ingredients, recipe, glass, category, iba, alcoholic
+    FROM cocktails
+    WHERE id = ANY(%s)
+"""
+
+# K nearest per query vector, all queries in one round trip
+MULTI_SEARCH_SQL = """
+    SELECT q.ord, c.*
+    FROM unnest(%s::halfvec[]) WITH ORDINALITY AS q(vec, ord)
+    CROSS JOIN LATERAL (
+        SELECT id, name, ingredients, recipe, glass, category, iba, alcoholic,
+            -(embedding <#> q.vec) as similarity
+        FROM cocktails
+        ORDER BY embedding <#> q.vec
+        LIMIT %s
+    ) c
+    WHERE c.similarity > %s
+    ORDER BY q.ord, c.similarity DESC
+"""
+
+# SYSTEM_ROWS reads only enough random pages for the sample, and shuffling
+# the oversampled rows breaks up runs of neighbours from the same page
+RANDOM_SQL = """
+    SELECT id, name, ingredients, recipe, glass, category, iba, alcoholic
+    FROM cocktails TABLESAMPLE SYSTEM_ROWS(%s)
+    ORDER BY RANDOM()
+    LIMIT %s
+"""
+
+# For databases set up before tsm_system_rows was enabled
+RANDOM_FALLBACK_SQL = """
+    SELECT id, name, ingredients, recipe, glass, category, iba, alcoholic
+    FROM cocktails
+    ORDER BY RANDOM()
+    LIMIT %s
+"""
+
+# Prompt per preference term; multi-term preferences average the term embeddings
+PROMPTS = {
+    'ingredients': "cocktail with {}",
+    'style': "cocktail that is {}",
+    'occasion': "cocktail for {}",
+    'alcoholic': "cocktail that is {}",
+}
+
+@dataclass
+class Cocktail:
+    """
+    One cocktails row; similarity is set only by the vector searches
+    """
+    id: int
+    name: str
+    ingredients: str
+    recipe: str | None
+    glass: str | None
+    category: str | None
+    iba: str | None
+    alcoholic: str | None
+    similarity: float | None = None
+
+class FaissBackend:
+    """
+    In-process top-K by inner product over the stored embeddings; Postgres only
+    serves the rows of the hits. Large indexes move to the GPU when faiss has
+    GPU support, and the index is rebuilt from the table in the background once
+    the table has changed under it.
+    """
+    def __init__(self, db_setup, index, state, checked_at=None):
+        self.db_setup = db_setup
+        self._gpu = None
+        self.index = self._to_device(index)
+        self._lock = threading.Lock()
+        self._rebuilding = False
+        self._checked_at = time.monotonic() if checked_at is None else checked_at
+        # (row count, newest id) the index is known to cover
+        self._state = state
+
+    @classmethod
+    def load(cls, db_setup):
+        """
+        The index written by data_preprocessing.py, else one built from the table
+        when it has at least FAISS_MIN_ROWS rows. None means search with pgvector.
+        """
+        if faiss is None:
+            return None
+        index = cls._read_index()
+        try:
+            if index is not None:
+                # The file may predate rows loaded since it was written: describe
+                # it by its own contents and compare with the table on first use
+                return cls(db_setup, index, cls._index_state(index), checked_at=float('-inf'))
+            state = cls._table_state(db_setup)
+            if state[0] < FAISS_MIN_ROWS:
+                return None
+            return cls(db_setup, cls._build_from_db(db_setup), state)
+        except Exception:
+            logger.exception("Error setting up FAISS, falling back to pgvector")
+            return None
+
+    @staticmethod
+    def _read_index():
+        if not os.path.exists(FAISS_INDEX_PATH):
+            return None
+        try:
+            # mmap keeps startup cheap and lets processes share the pages
+            return faiss.read_index(FAISS_INDEX_PATH, faiss.IO_FLAG_MMAP)
+        except Exception:
+            try:
+                return faiss.read_index(FAISS_INDEX_PATH)
+            except Exception:
+                logger.exception("Error loading FAISS index %s, falling back to pgvector", FAISS_INDEX_PATH)
+                return None
+
+    @staticmethod
+    def _index_state(index):
+        # IndexIDMap2 keeps its ids in id_map; unknown otherwise, which the
+        # first drift check treats as changed
+        id_map = getattr(index, 'id_map', None)
+        if id_map is None or index.ntotal == 0:
+            return (index.ntotal, None)
+        return (index.ntotal, int(faiss.vector_to_array(id_map).max()))
+
+    @staticmethod
+    def _table_state(db_setup):
+        # Row estimate and newest id: reloads and bulk inserts change one or both
+        with db_setup.get_connection() as conn:
+            row = conn.execute("""
+                SELECT reltuples::bigint, (SELECT max(id) FROM cocktails)
+                FROM pg_class WHERE oid = to_regclass('cocktails')
+            """).fetchone()
+        return (max(row[0], 0), row[1]) if row else (0, None)
+
+    @staticmethod
+    def _build_from_db(db_setup):
+        with db_setup.get_connection() as conn:
+            with conn.cursor(binary=True) as cursor:
+                cursor.execute("SELECT id, embedding::real[] FROM cocktails WHERE embedding IS NOT NULL")
+                rows = cursor.fetchall()
+        if not rows:
+            raise ValueError("no embeddings in cocktails")
+        ids = np.fromiter((r[0] for r in rows), dtype='int64', count=len(rows))
+        embs = np.array([r[1] for r in rows], dtype='float32')
+        faiss.normalize_L2(embs)
+
+        dim = embs.shape[1]
+        if len(rows) < FAISS_IVF_MIN_ROWS:
+            index = faiss.IndexIDMap2(faiss.IndexFlatIP(dim))
+        else:
+            nlist = int(np.sqrt(len(rows)))
+            index = faiss.IndexIVFFlat(faiss.IndexFlatIP(dim), dim, nlist, faiss.METRIC_INNER_PRODUCT)
+            index.train(embs)
+            index.nprobe = min(nlist, 32)
+        index.add_with_ids(embs, ids)
+        return index
+
+    def _to_device(self, index):
+        if (
+            index.ntotal < FAISS_GPU_MIN_ROWS
+            or not hasattr(faiss, 'StandardGpuResources')
+            or faiss.get_num_gpus() == 0
+        ):
+            return index
+        try:
+            self._gpu = self._gpu or faiss.StandardGpuResources()
+            return faiss.index_cpu_to_gpu(self._gpu, 0, index)
+        except Exception as e:
+            logger.warning("Error moving FAISS index to GPU, searching on CPU: %s", e)
+            return index
+
+    def search(self, query_embedding, limit, threshold):
+        """
+        (id, similarity) pairs above the threshold, best first
+        """
+        self._maybe_refresh()
+        q = np.array(query_embedding, dtype='float32').reshape(1, -1)
+        faiss.normalize_L2(q)
+        index = self.index
+        # GPU resources must not be used from several threads at once
+        with self._lock if self._gpu is not None else nullcontext():
+            scores, ids = index.search(q, limit)
+        return [(int(i), float(sc)) for i, sc in zip(ids[0], scores[0]) if i != -1 and sc > threshold]
+
+    def _maybe_refresh(self):
+        if self._rebuilding or time.monotonic() - self._checked_at < FAISS_CHECK_SECONDS:
+            return
+        with self._lock:
+            if self._rebuilding:
+                return
+            self._rebuilding = True
+            self._checked_at = time.monotonic()
+        threading.Thread(target=self._refresh, daemon=True).start()
+
+    def _refresh(self):
+        try:
+            n_rows, max_id = state = self._table_state(self.db_setup)
+            built_rows, built_max_id = self._state
+            if max_id != built_max_id or abs(n_rows - built_rows) > FAISS_REBUILD_DELTA * max(built_rows, 1):
+                index = self._build_from_db(self.db_setup)
+                # The GPU copy uses the shared GPU resources, so it waits for searches
+                with self._lock:
+                    self.index, self._state = self._to_device(index), state
+        except Exception:
+            logger.exception("Error rebuilding FAISS index")
+        finally:
+            self._rebuilding = False
+
 class CocktailRecommender:
+    """
+    Safe to share between threads: encoding, the embedding cache and the
+    connection pool are thread-safe, so one instance per process is enough.
+    """
     def __init__(self):
         self.model_name = os.getenv('MODEL_NAME', 'all-MiniLM-L6-v2')
-        self.model = SentenceTransformer(self.model_name)
+        self.model = self._load_model(self.model_name)
+        self.model.eval()
         self.db_setup = DBSetup()
+        self.faiss = FaissBackend.load(self.db_setup)
+        self._ef_search = None
+        self._row_count = None
+        self._table_checked_at = time.monotonic()
+        # Per-instance LRU memo of query text -> embedding; prompts repeat a lot
+        self._embeddings = OrderedDict()
+        self._embeddings_lock = threading.Lock()
+
+    @staticmethod
+    def _load_model(model_name):
+        # Opt-in ONNX Runtime backend for the query encoder; the default file is
+        # the int8 dynamic-quantized export shipped with the sentence-transformers models
+        if MODEL_BACKEND == 'onnx':
+            try:
+                return SentenceTransformer(
+                    model_name,
+                    backend='onnx',
+                    model_kwargs={'file_name': ONNX_MODEL_FILE, 'provider': 'CPUExecutionProvider'},
+                )
+            except Exception as e:
+                logger.warning("ONNX backend unavailable, using torch: %s", e)
+        return SentenceTransformer(model_name)
 
     def get_user_preferences_embedding(self, preferences):
         pref_text = ' '.join(preferences)
-        return self.model.encode([pref_text])[0]
+        return self._embed_text(pref_text)
 
-    @staticmethod
-    def _to_vector(obj) -> list:
-        if hasattr(obj, 'tolist'):
-            return obj.tolist()
-        return list(obj)
+    def _embed_text(self, text):
+        with self._embeddings_lock:
+            emb = self._embeddings.get(text)
+            if emb is not None:
+                self._embeddings.move_to_end(text)
+                return emb
+        return self._cache_embeddings([text], self.model.encode([text], normalize_embeddings=True))[0]
+
+    def _cache_embeddings(self, texts, embs):
+        with self._embeddings_lock:
+            for text, emb in zip(texts, embs):
+                # Cached arrays are shared between callers
+                emb.setflags(write=False)
+                self._embeddings[text] = emb
+                self._embeddings.move_to_end(text)
+            while len(self._embeddings) > EMBED_CACHE_SIZE:
+                self._embeddings.popitem(last=False)
+        return embs
+
+    def warm_embedding_cache(self, texts):
+        """
+        Embed the uncached ones of common prompts in one batch and seed the
+        embedding cache with them
+        """
+        texts = [t for t in dict.fromkeys(texts) if t]
+        with self._embeddings_lock:
+            missing = [t for t in texts if t not in self._embeddings]
+        if missing:
+            self._cache_embeddings(missing, self.model.encode(missing, batch_size=64, normalize_embeddings=True))
 
     def search_similar_cocktails(
         self,
         query_embedding,
         limit: int = 10,
         threshold: float = 0.3,
+        raise_errors: bool = False,
     ):
+        """
+        Nearest cocktails above the similarity threshold. Errors are logged and
+        give an empty list unless raise_errors is set, for callers that cache
+        results and must not cache a failure as "no matches".
+        """
         try:
+            if self.faiss is not None:
+                return self._search_faiss(query_embedding, limit, threshold)
+
+            self._expire_table_cache()
             with self.db_setup.get_connection() as conn:
-                with conn.cursor() as cursor:
-                    cursor.execute("""SELECT COUNT(*) FROM cocktails""")
-                    total_cocktails = cursor.fetchone()[0]
-                    print(f"Total cocktails in database: {total_cocktails}")
-                    if total_cocktails == 0:
-                        print("❌ No cocktails found in the database.")
+                with conn.cursor(binary=True) as cursor:
+                    if not self._has_cocktails(cursor):
+                        logger.debug("No cocktails found in the database")
                         return []
                     
-                    vec = self._to_vector(query_embedding)
-                    cursor.execute("""
-                        SELECT id, name, ingredients, recipe, glass, category, iba, alcoholic,
-                            1 - (embedding <=> %s::vector) as similarity
-                        FROM cocktails
-                        WHERE 1 - (embedding <=> %s::vector) > %s
-                        ORDER BY similarity DESC
-                        LIMIT %s
-                    """, (vec, vec, threshold, limit))
+                    # Candidate list size for the HNSW scan, as tuned by DBSetup
+                    if self._ef_search is None:
+                        self._ef_search = self._load_ef_search(cursor)
+                    fetch = self._overfetch(limit)
+                    # Sent in pgvector's binary format by the pool's numpy dumper
+                    vec = np.asarray(query_embedding, dtype=np.float32)
 
-                    return cursor.fetchall()
-        except Exception as e:
-            print(f"Error searching for cocktails: {e}")
-            import traceback
-            traceback.print_exc()
+                    # Pipelined: the ef_search setting and the search share one round trip
+                    with conn.pipeline():
+                        cursor.execute(EF_SEARCH_SQL, (str(max(self._ef_search, fetch)),), prepare=True)
+                        cursor.row_factory = class_row(Cocktail)
+                        cursor.execute(SEARCH_SQL, (vec, vec, fetch, threshold, limit), prepare=True)
+                        return cursor.fetchall()
+        except Exception:
+            if raise_errors:
+                raise
+            logger.exception("Error searching for cocktails")
+            return []
+
+    def _expire_table_cache(self):
+        # Bulk loads change the row count and re-tune ef_search; re-read both
+        # on the same cadence as the FAISS drift check
+        now = time.monotonic()
+        if now - self._table_checked_at >= FAISS_CHECK_SECONDS:
+            self._ef_search = self._row_count = None
+            self._table_checked_at = now
+
+    def _has_cocktails(self, cursor):
+        """
+        Empty-table guard from the planner's row estimate, instead of a COUNT(*) per call
+        """
+        if not self._row_count:
+            cursor.execute("SELECT reltuples::bigint FROM pg_class WHERE oid = to_regclass('cocktails')")
+            row = cursor.fetchone()
+            estimate = row[0] if row else 0
+            if estimate <= 0:
+                # Never analyzed (-1) or not yet re-analyzed after a load
+                cursor.execute("SELECT EXISTS (SELECT 1 FROM cocktails)")
+                estimate = 1 if cursor.fetchone()[0] else 0
+            self._row_count = estimate
+        return self._row_count > 0
+
+    async def _ahas_cocktails(self, cursor):
+        if not self._row_count:
+            await cursor.execute("SELECT reltuples::bigint FROM pg_class WHERE oid = to_regclass('cocktails')")
+            row = await cursor.fetchone()
+            estimate = row[0] if row else 0
+            if estimate <= 0:
+                await cursor.execute("SELECT EXISTS (SELECT 1 FROM cocktails)")
+                estimate = 1 if (await cursor.fetchone())[0] else 0
+            self._row_count = estimate
+        return self._row_count > 0
+
+    @staticmethod
+    def _overfetch(limit):
+        # Neighbours under the threshold are dropped after the KNN scan;
+        # fetch extra so a few drops still leave `limit` rows. HNSW returns at
+        # most ef_search rows, so the search list is widened to match.
+        return 4 * limit
+
+    @staticmethod
+    def _load_ef_search(cursor):
+        # Databases set up before cocktail_index_config existed keep the default
+        cursor.execute("SELECT to_regclass('cocktail_index_config')")
+        if cursor.fetchone()[0] is None:
+            return hnsw_params(0)['ef_search']
+        cursor.execute(
+            "SELECT ef_search FROM cocktail_index_config WHERE index_name = %s",
+            (VECTOR_INDEX,)
+        )
+        row = cursor.fetchone()
+        return row[0] if row else hnsw_params(0)['ef_search']
+
+    @staticmethod
+    async def _aload_ef_search(cursor):
+        await cursor.execute("SELECT to_regclass('cocktail_index_config')")
+        if (await cursor.fetchone())[0] is None:
+            return hnsw_params(0)['ef_search']
+        await cursor.execute(
+            "SELECT ef_search FROM cocktail_index_config WHERE index_name = %s",
+            (VECTOR_INDEX,)
+        )
+        row = await cursor.fetchone()
+        return row[0] if row else hnsw_params(0)['ef_search']
+
+    def _search_faiss(self, query_embedding, limit, threshold):
+        """
+        Top-K by inner product on the FAISS index, then fetch metadata for the hits
+        """
+        hits = self.faiss.search(query_embedding, limit, threshold)
+        if not hits:
             return []
 
+        with self.db_setup.get_connection() as conn:
+            with conn.cursor(row_factory=class_row(Cocktail)) as cursor:
+                cursor.execute(BY_IDS_SQL, ([i for i, _ in hits],), prepare=True)
+                by_id = {c.id: c for c in cursor.fetchall()}
+        return [replace(by_id[i], similarity=sc) for i, sc in hits if i in by_id]
+
+    # Async variants, for callers that fan several queries out on one event loop
+    async def asearch_similar_cocktails(
+        self,
+        query_embedding,
+        limit: int = 10,
+        threshold: float = 0.3,
+    ):
+        try:
+            async with self.db_setup.get_async_connection() as conn:
+                async with conn.cursor(binary=True) as cursor:
+                    if self.faiss is not None:
+                        # Off the event loop: the FAISS search blocks for the whole scan
+                        hits = await asyncio.to_thread(self.faiss.search, query_embedding, limit, threshold)
+                        if not hits:
+                            return []
+                        cursor.row_factory = class_row(Cocktail)
+                        await cursor.execute(BY_IDS_SQL, ([i for i, _ in hits],), prepare=True)
+                        by_id = {c.id: c for c in await cursor.fetchall()}
+                        return [replace(by_id[i], similarity=sc) for i, sc in hits if i in by_id]
+
+                    self._expire_table_cache()
+                    if not await self._ahas_cocktails(cursor):
+                        logger.debug("No cocktails found in the database")
+                        return []
+                    if self._ef_search is None:
+                        self._ef_search = await self._aload_ef_search(cursor)
+                    fetch = self._overfetch(limit)
+                    vec = np.asarray(query_embedding, dtype=np.float32)
+
+                    async with conn.pipeline():
+                        await cursor.execute(EF_SEARCH_SQL, (str(max(self._ef_search, fetch)),), prepare=True)
+                        cursor.row_factory = class_row(Cocktail)
+                        await cursor.execute(SEARCH_SQL, (vec, vec, fetch, threshold, limit), prepare=True)
+                        return await cursor.fetchall()
+        except Exception:
+            logger.exception("Error searching for cocktails")
+            return []
+
+    async def aget_random_cocktails(self, limit=5):
+        try:
+            async with self.db_setup.get_async_connection() as conn:
+                async with conn.cursor(row_factory=class_row(Cocktail)) as cur:
+                    try:
+                        await cur.execute(RANDOM_SQL, (self._random_sample_size(limit), limit))
+                    except psycopg.errors.UndefinedObject:
+                        await conn.rollback()
+                        await cur.execute(RANDOM_FALLBACK_SQL, (limit,))
+                    return await cur.fetchall()
+        except Exception:
+            logger.exception("Error getting random cocktails")
+            return []
+
+    def recommend_multi(self, queries, limit=10, threshold=0.3):
+        """
+        Top matches for several prompt texts: one batched encode, one search round trip.
+        Returns a list of result rows per query, in query order.
+        """
+        queries = list(queries)
+        if not queries:
+            return []
+        self.warm_embedding_cache(queries)
+        embs = [self._embed_text(q) for q in queries]
+        try:
+            if self.faiss is not None:
+                return self._search_faiss_multi(embs, limit, threshold)
+
+            self._expire_table_cache()
+            with self.db_setup.get_connection() as conn:
+                with conn.cursor(binary=True) as cursor:
+                    if self._ef_search is None:
+                        self._ef_search = self._load_ef_search(cursor)
+                    fetch = self._overfetch(limit)
+                    # Text literals: a halfvec[] parameter needs the array type,
+                    # which the untyped binary dumper can't provide
+                    vecs = [vector_literal(e) for e in embs]
+
+                    with conn.pipeline():
+                        cursor.execute(EF_SEARCH_SQL, (str(max(self._ef_search, fetch)),), prepare=True)
+                        cursor.execute(MULTI_SEARCH_SQL, (vecs, fetch, threshold), prepare=True)
+                        rows = cursor.fetchall()
+                    results = [[] for _ in queries]
+                    for ord_, *row in rows:
+                        if len(results[ord_ - 1]) < limit:
+                            results[ord_ - 1].append(Cocktail(*row))
+                    return results
+        except Exception:
+            logger.exception("Error searching for cocktails")
+            return [[] for _ in queries]
+
+    def _search_faiss_multi(self, embs, limit, threshold):
+        hits = [self.faiss.search(e, limit, threshold) for e in embs]
+        ids = list({i for per_query in hits for i, _ in per_query})
+        if not ids:
+            return [[] for _ in embs]
+
+        with self.db_setup.get_connection() as conn:
+            with conn.cursor(row_factory=class_row(Cocktail)) as cursor:
+                cursor.execute(BY_IDS_SQL, (ids,), prepare=True)
+                by_id = {c.id: c for c in cursor.fetchall()}
+        return [
+            [replace(by_id[i], similarity=sc) for i, sc in per_query if i in by_id]
+            for per_query in hits
+        ]
+
     # Recommendation helpers
-    def recommend_by_ingredients(self, ingredients, limit=10):
+    @staticmethod
+    def _prompt_groups(**terms):
+        # One prompt per term, grouped by preference kind. Case, order and
+        # repeats don't change the query, so they don't split the cache
+        groups = []
+        for kind, values in terms.items():
+            values = dict.fromkeys(v.strip().lower() for v in values or () if v and v.strip())
+            if values:
+                groups.append([PROMPTS[kind].format(v) for v in values])
+        return groups
+
+    def embed_preferences(self, ingredients=(), style=(), occasion=None, alcoholic=None):
+        """
+        Query embedding for a set of preferences: the normalized sum of one
+        vector per preference kind, each the mean of its terms' embeddings.
+        Terms are embedded on their own, so a warmed vocabulary covers any
+        combination without another forward pass. None if nothing was given.
+        """
+        groups = self._prompt_groups(
+            ingredients=ingredients,
+            style=style,
+            occasion=[occasion] if occasion else (),
+            alcoholic=[alcoholic] if alcoholic else (),
+        )
+        if not groups:
+            return None
+        emb = np.sum([np.mean([self._embed_text(p) for p in g], axis=0) for g in groups], axis=0)
+        return emb / (np.linalg.norm(emb) or 1.0)
+
+    def warm_vocabulary(self, ingredients=(), style=(), occasion=(), alcoholic=()):
+        """
+        Pre-embed the known terms of each preference kind in one batch
+        """
+        groups = self._prompt_groups(ingredients=ingredients, style=style, occasion=occasion, alcoholic=alcoholic)
+        self.warm_embedding_cache(p for g in groups for p in g)
+
+    def recommend_by_ingredients(self, ingredients, limit=10, threshold=0.3):
         """
         Recommend by preferred ingredients
         """
-        text = f"cocktail with {' and '.join(ingredients)}"
-        emb = self.get_user_preferences_embedding([text])
-        return self.search_similar_cocktails(emb, limit=limit)
-    
-    def recommend_by_style(self, style, limit=10):
+        return self.recommend_by_mixed_preferences(ingredients=ingredients, limit=limit, threshold=threshold)
+
+    def recommend_by_style(self, style, limit=10, threshold=0.3):
         """
         Recommend by preferred style (e.g., sweet, strong, fruity)
         """
-        text = f"cocktail that is {' and '.join(style)}"
-        emb = self.get_user_preferences_embedding([text])
-        return self.search_similar_cocktails(emb, limit=limit)
+        return self.recommend_by_mixed_preferences(style=style, limit=limit, threshold=threshold)
 
-    def recommend_by_occasion(self, occasion, limit=10):
+    def recommend_by_occasion(self, occasion, limit=10, threshold=0.3):
         """
         Recommend by occasion (e.g., party, relaxing, summer)
         """
-        text = f"cocktail for {occasion}"
-        emb = self.get_user_preferences_embedding([text])
-        return self.search_similar_cocktails(emb, limit=limit)
+        return self.recommend_by_mixed_preferences(occasion=occasion, limit=limit, threshold=threshold)
 
     def recommend_by_mixed_preferences(
         self,
@@ -85,127 +625,105 @@ class CocktailRecommender:
         style=None,
         occasion=None,
         alcoholic=None,
-        limit=10
+        limit=10,
+        threshold=0.3,
     ):
         """
         Recommend by mixed preferences
         """
-        parts = []
-        if ingredients:
-            parts.append(f"contains {' and '.join(ingredients)}")
-        if style:
-            parts.append(f"is {' and '.join(style)}")
-        if occasion:
-            parts.append(f"perfect for {occasion}")
-        if alcoholic:
-            parts.append(f"is {alcoholic}")
-        if not parts:
+        emb = self.embed_preferences(ingredients, style, occasion, alcoholic)
+        if emb is None:
             return []
-
-        emb = self.get_user_preferences_embedding(parts)
-        return self.search_similar_cocktails(emb, limit=limit)
+        return self.search_similar_cocktails(emb, limit=limit, threshold=threshold)
 
     # Lookups
-    def get_cocktail_by_name(self, name):
+    @staticmethod
+    def _random_sample_size(limit):
+        return max(100, 10 * limit)
+
+    def get_cocktail_by_name(self, name, raise_errors=False):
         try:
             with self.db_setup.get_connection() as conn:
-                with conn.cursor() as cursor:
+                with conn.cursor(row_factory=class_row(Cocktail)) as cursor:
                     cursor.execute("""
                         SELECT id, name, ingredients, recipe, glass, category, iba, alcoholic
                         FROM cocktails
-                        WHERE LOWER(name) LIKE LOWER(%s)
+                        WHERE name ILIKE %s
                         LIMIT 5
                     """, (f"%{name}%",))
                     return cursor.fetchall()
-        except Exception as e:
-            print(f"Error fetching cocktail by name: {e}")
+        except Exception:
+            if raise_errors:
+                raise
+            logger.exception("Error fetching cocktail by name %r", name)
             return []
 
-    def get_random_cocktails(self, limit=5):
+    def get_random_cocktails(self, limit=5, raise_errors=False):
         try:
             with self.db_setup.get_connection() as conn:
                 with conn.cursor() as cur:
-                    cur.execute("SELECT COUNT(*) FROM cocktails")
-                    count = cur.fetchone()[0]
-                    print(f"Database contains {count} cocktails")
-                    if count == 0:
-                        print("Warning: No cocktails found. Have you run data_processor.py?")
+                    if not self._has_cocktails(cur):
+                        logger.debug("No cocktails found; has data_preprocessing.py been run?")
                         return []
 
-                    cur.execute(
-                        """
-                        SELECT id, name, ingredients, recipe, glass, category, iba, alcoholic
-                        FROM cocktails
-                        ORDER BY RANDOM()
-                        LIMIT %s
-                        """,
-                        (limit,),
-                    )
+                    cur.row_factory = class_row(Cocktail)
+                    try:
+                        cur.execute(RANDOM_SQL, (self._random_sample_size(limit), limit))
+                    except psycopg.errors.UndefinedObject:
+                        conn.rollback()
+                        cur.execute(RANDOM_FALLBACK_SQL, (limit,))
                     return cur.fetchall()
-        except Exception as e:
-            print(f"Error getting random cocktails: {e}")
-            import traceback
-            traceback.print_exc()
+        except Exception:
+            if raise_errors:
+                raise
+            logger.exception("Error getting random cocktails")
             return []
 
-    def get_cocktail_by_category(self, category, limit=10):
+    def get_cocktail_by_category(self, category, limit=10, raise_errors=False):
         try:
             with self.db_setup.get_connection() as conn:
-                with conn.cursor() as cur:
+                with conn.cursor(row_factory=class_row(Cocktail)) as cur:
                     cur.execute(
                         """
                         SELECT id, name, ingredients, recipe, glass, category, iba, alcoholic
                         FROM cocktails
-                        WHERE LOWER(category) LIKE LOWER(%s)
+                        WHERE category ILIKE %s
                         ORDER BY name
                         LIMIT %s
                         """,
                         (f"%{category}%", limit),
                     )
                     return cur.fetchall()
-        except Exception as e:
-            print(f"Error getting cocktails by category: {e}")
+        except Exception:
+            if raise_errors:
+                raise
+            logger.exception("Error getting cocktails by category %r", category)
             return []
 
-    def format_result(self, result):
-        if len(result) == 9: # with similarity
-            id_, name, ingredients, recipe, glass, category, iba, alcoholic, similarity = result
-            return {
-                'id': id_,
-                'name': name,
-                'ingredients': ingredients,
-                'recipe': recipe,
-                'glass': glass,
-                'category': category,
-                'iba': iba,
-                'alcoholic': alcoholic,
-                'similarity': round(similarity * 100, 1) 
-            }
-        else: # without similarity
-            id_, name, ingredients, recipe, glass, category, iba, alcoholic = result
-            return {
-                'id': id_,
-                'name': name,
-                'ingredients': ingredients,
-                'recipe': recipe,
-                'glass': glass,
-                'category': category,
-                'iba': iba,
-                'alcoholic': alcoholic
-            }
+_recommender = None
+_recommender_lock = threading.Lock()
+
+def get_recommender():
+    """
+    Process-wide CocktailRecommender, built once on first use
+    """
+    global _recommender
+    if _recommender is None:
+        with _recommender_lock:
+            if _recommender is None:
+                _recommender = CocktailRecommender()
+    return _recommender
 
 if __name__ == "__main__":
-    recommender = CocktailRecommender()
+    recommender = get_recommender()
 
     print('Testing...')
     results = recommender.recommend_by_ingredients(['vodka', 'lime'], limit=3)
     print(f'\nRecommendations for vodka and lime:')
-    for res in results:
-        cocktail = recommender.format_result(res)
-        print(f" - {cocktail['name']} (Similarity: {cocktail.get('similarity', 'N/A')}%)")
+    for cocktail in results:
+        print(f" - {cocktail.name} (Similarity: {round(cocktail.similarity * 100, 1)}%)")
     
     results = recommender.get_random_cocktails(limit=3)
     print(f'\nRandom cocktails:')
-    for res in results:
-        cocktail = recommender.format_result(res)
-        print(f" - {cocktail['name']}")
\ No newline at end of file
+    for cocktail in results:
+        print(f" - {cocktail.name}")
\ No newline at end of file